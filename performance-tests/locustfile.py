@@ -3,258 +3,311 @@ Locust Performance and Stress Tests for E-commerce Microservices
 This file contains performance tests simulating real-world usage scenarios.
 """
 
-from locust import HttpUser, task, between, SequentialTaskSet
-import json
+from locust import task
+from locust.contrib.fasthttp import FastHttpUser
+from array import array
+import itertools
 import random
 
+import gevent
+import orjson
 
-class UserRegistrationTaskSet(SequentialTaskSet):
-    """Simulates user registration flow"""
+
+# Random test data is drawn once at import; tasks index into these pools instead of
+# calling random.randint/uniform on every request
+POOL_MASK = (1 << 16) - 1
+ID_POOL = array("i", [random.randint(1, 1000) for _ in range(POOL_MASK + 1)])
+PRODUCT_ID_POOL = array("i", [random.randint(1, 100) for _ in range(POOL_MASK + 1)])
+SUFFIX_POOL = array("i", [random.randint(1000, 9999) for _ in range(POOL_MASK + 1)])
+PHONE_POOL = array("q", [random.randint(1000000000, 9999999999) for _ in range(POOL_MASK + 1)])
+FEE_POOL = [round(random.uniform(10.0, 500.0), 2) for _ in range(POOL_MASK + 1)]
+FLOW_FEE_POOL = [round(random.uniform(50.0, 300.0), 2) for _ in range(POOL_MASK + 1)]
+next_draw = itertools.count(random.getrandbits(16)).__next__
+
+# Detail paths for every ID the pools can produce, looked up instead of formatted per request
+PRODUCT_PATHS = {i: f"/api/products/{i}" for i in range(1, 101)}
+USER_PATHS = {i: f"/api/users/{i}" for i in range(1, 1001)}
+ORDER_PATHS = {i: f"/api/orders/{i}" for i in range(1, 1001)}
+
+
+def pooled_between(min_wait, max_wait):
+    """
+    Drop-in for locust's between() that cycles through wait times drawn once per user
+    class, instead of calling into random on every wait
+    """
+    next_wait = itertools.cycle([random.uniform(min_wait, max_wait) for _ in range(4096)]).__next__
+    return lambda instance: next_wait()
+
+
+# Request bodies are serialized up front and posted as raw bytes with these headers.
+# FastHttpSession adds keys to the headers dict it is given, so each user posts with its own copy
+JSON_HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
+
+
+class ApiUser(FastHttpUser):
+    """
+    Base class for all users, backed by geventhttpclient instead of python-requests
+    """
+    abstract = True
+
+    connection_timeout = 5.0  # Fail fast instead of the 60s default when the gateway is unreachable
+    network_timeout = 10.0  # Treat a stalled keep-alive socket as a failure rather than waiting 60s
+
+    # Connections are kept alive and reused across tasks. A user runs a single greenlet
+    # (two during the shopping flow's parallel steps), so a small pool is enough. On the
+    # load generator host, also set net.ipv4.tcp_tw_reuse=1 so reconnects are not starved
+    # by sockets in TIME_WAIT.
+    concurrency = 2
+
+    etag_cache_size = 256  # Max number of paths per user to remember ETags for; 0 disables revalidation
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        self.json_headers = dict(JSON_HEADERS)
+        self.etags = {}
+
+    def cached_get(self, path, name):
+        """
+        GET that revalidates with the ETag of the previous response for the same path,
+        the way a browser cache would. Unchanged resources come back as a 304 without a
+        body, so there is nothing to download or decompress on the load generator.
+        """
+        conditional_headers = self.etags.get(path)
+        if conditional_headers is None:
+            response = self.client.get(path, name=name)
+        else:
+            with self.client.get(path, headers=conditional_headers, catch_response=True, name=name) as response:
+                if response.status_code == 304:
+                    response.success()
+                    return response
+        if response.status_code == 200:
+            etag = response.headers.get("ETag")
+            if etag and self.etag_cache_size > 0:
+                if path not in self.etags and len(self.etags) >= self.etag_cache_size:
+                    del self.etags[next(iter(self.etags))]
+                self.etags[path] = {"If-None-Match": etag}
+        return response
+
+
+class EcommerceUser(ApiUser):
+    """
+    Main user class that simulates a typical e-commerce user behavior
+    """
+    wait_time = pooled_between(1, 3)  # Wait between 1 and 3 seconds between tasks
+    
+    ORDER_TEMPLATE = b'{"orderDesc":"Performance Test Order %d","orderFee":%.2f,"cart":{"cartId":%d}}'
     
     def on_start(self):
-        """Called when a user starts"""
+        """Called when a simulated user starts"""
         self.user_id = None
-        self.user_data = {
+        self.user_body = orjson.dumps({
             "firstName": f"TestUser{random.randint(1000, 9999)}",
             "lastName": "Performance",
             "email": f"test{random.randint(1000, 9999)}@example.com",
             "phone": f"{random.randint(1000000000, 9999999999)}"
-        }
+        })
+        self.favourite_body = orjson.dumps({
+            "userId": random.randint(1, 1000),
+            "productId": random.randint(1, 100)
+        })
+        self.cart_id = random.randint(1, 1000)
+        self.payment_body = orjson.dumps({
+            "orderDto": {
+                "orderId": random.randint(1, 1000)
+            }
+        })
     
-    @task
+    # User registration (10%)
+    @task(10)
     def register_user(self):
         """Register a new user"""
         with self.client.post(
             "/api/users",
-            json=self.user_data,
+            data=self.user_body,
+            headers=self.json_headers,
             catch_response=True,
             name="Register User"
         ) as response:
             if response.status_code == 200:
-                try:
-                    data = response.json()
-                    self.user_id = data.get("userId")
-                    response.success()
-                except:
+                body = response.content
+                if body[:1] == b"{":
+                    try:
+                        self.user_id = orjson.loads(body).get("userId")
+                        response.success()
+                    except orjson.JSONDecodeError:
+                        response.failure("Invalid response format")
+                else:
                     response.failure("Invalid response format")
             else:
                 response.failure(f"Status code: {response.status_code}")
-
-
-class ProductBrowseTaskSet(SequentialTaskSet):
-    """Simulates product browsing flow"""
     
-    @task
+    # Product browsing (40%)
+    @task(20)
     def browse_products(self):
         """Browse all products"""
-        self.client.get("/api/products", name="Browse Products")
+        self.cached_get("/api/products", name="Browse Products")
     
-    @task
+    @task(20)
     def view_product(self):
         """View a specific product"""
-        product_id = random.randint(1, 100)
-        self.client.get(f"/api/products/{product_id}", name="View Product")
-
-
-class FavouriteManagementTaskSet(SequentialTaskSet):
-    """Simulates managing favourites"""
-    
-    def on_start(self):
-        """Setup test data"""
-        self.user_id = random.randint(1, 1000)
-        self.product_id = random.randint(1, 100)
+        product_id = PRODUCT_ID_POOL[next_draw() & POOL_MASK]
+        self.cached_get(PRODUCT_PATHS[product_id], name="View Product")
     
-    @task
+    # Favourite management (20%)
+    @task(10)
     def add_to_favourites(self):
         """Add product to favourites"""
-        favourite_data = {
-            "userId": self.user_id,
-            "productId": self.product_id
-        }
-        with self.client.post(
+        self.client.post(
             "/api/favourites",
-            json=favourite_data,
-            catch_response=True,
+            data=self.favourite_body,
+            headers=self.json_headers,
             name="Add to Favourites"
-        ) as response:
-            if response.status_code in [200, 201]:
-                response.success()
-            else:
-                response.failure(f"Status code: {response.status_code}")
+        )
     
-    @task
+    @task(10)
     def view_favourites(self):
         """View user favourites"""
-        self.client.get("/api/favourites", name="View Favourites")
-
-
-class OrderCreationTaskSet(SequentialTaskSet):
-    """Simulates order creation flow"""
-    
-    def on_start(self):
-        """Setup test data"""
-        self.cart_id = random.randint(1, 1000)
+        self.cached_get("/api/favourites", name="View Favourites")
     
-    @task
+    # Order creation (20%)
+    @task(10)
     def create_order(self):
         """Create a new order"""
-        order_data = {
-            "orderDesc": f"Performance Test Order {random.randint(1000, 9999)}",
-            "orderFee": round(random.uniform(10.0, 500.0), 2),
-            "cart": {
-                "cartId": self.cart_id
-            }
-        }
-        with self.client.post(
+        order_body = self.ORDER_TEMPLATE % (
+            SUFFIX_POOL[next_draw() & POOL_MASK],
+            FEE_POOL[next_draw() & POOL_MASK],
+            self.cart_id
+        )
+        self.client.post(
             "/api/orders",
-            json=order_data,
-            catch_response=True,
+            data=order_body,
+            headers=self.json_headers,
             name="Create Order"
-        ) as response:
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    self.order_id = data.get("orderId")
-                    response.success()
-                except:
-                    response.failure("Invalid response format")
-            else:
-                response.failure(f"Status code: {response.status_code}")
+        )
     
-    @task
+    @task(10)
     def view_orders(self):
         """View all orders"""
-        self.client.get("/api/orders", name="View Orders")
-
-
-class PaymentProcessingTaskSet(SequentialTaskSet):
-    """Simulates payment processing flow"""
-    
-    def on_start(self):
-        """Setup test data"""
-        self.order_id = random.randint(1, 1000)
+        self.cached_get("/api/orders", name="View Orders")
     
-    @task
+    # Payment processing (10%)
+    @task(5)
     def create_payment(self):
         """Create a payment for an order"""
-        payment_data = {
-            "orderDto": {
-                "orderId": self.order_id
-            }
-        }
-        with self.client.post(
+        self.client.post(
             "/api/payments",
-            json=payment_data,
-            catch_response=True,
+            data=self.payment_body,
+            headers=self.json_headers,
             name="Create Payment"
-        ) as response:
-            if response.status_code in [200, 201]:
-                response.success()
-            else:
-                response.failure(f"Status code: {response.status_code}")
+        )
     
-    @task
+    @task(5)
     def view_payments(self):
         """View all payments"""
-        self.client.get("/api/payments", name="View Payments")
+        self.cached_get("/api/payments", name="View Payments")
 
 
-class EcommerceUser(HttpUser):
-    """
-    Main user class that simulates a typical e-commerce user behavior
-    """
-    wait_time = between(1, 3)  # Wait between 1 and 3 seconds between tasks
-    
-    tasks = {
-        UserRegistrationTaskSet: 10,  # 10% of users register
-        ProductBrowseTaskSet: 40,      # 40% browse products
-        FavouriteManagementTaskSet: 20,  # 20% manage favourites
-        OrderCreationTaskSet: 20,      # 20% create orders
-        PaymentProcessingTaskSet: 10   # 10% process payments
-    }
-    
-    def on_start(self):
-        """Called when a simulated user starts"""
-        pass
-
-
-class HighLoadUser(HttpUser):
+class HighLoadUser(ApiUser):
     """
     High-load user class for stress testing
     Simulates rapid API calls
     """
-    wait_time = between(0.1, 0.5)  # Very short wait time
+    wait_time = pooled_between(0.1, 0.5)  # Very short wait time
+    default_headers = {"Cache-Control": "max-age=60"}  # Let a caching proxy answer repeated GETs
+    
+    # Request names this class reports under, fixed per class rather than built per request
+    BROWSE_PRODUCTS_NAME = "High Load - Browse Products"
+    VIEW_PRODUCT_NAME = "High Load - View Product"
+    VIEW_USERS_NAME = "High Load - View Users"
+    
+    # Product view paths generated ahead of time, so a task only picks the next one and sends it
+    PRODUCT_PATH_POOL = [PRODUCT_PATHS[product_id] for product_id in PRODUCT_ID_POOL]
     
     @task(3)
     def browse_products(self):
         """Frequent product browsing"""
-        self.client.get("/api/products", name="High Load - Browse Products")
+        self.cached_get("/api/products", name=self.BROWSE_PRODUCTS_NAME)
     
     @task(2)
     def view_products(self):
         """Frequent product viewing"""
-        product_id = random.randint(1, 100)
-        self.client.get(f"/api/products/{product_id}", name="High Load - View Product")
+        self.cached_get(self.PRODUCT_PATH_POOL[next_draw() & POOL_MASK], name=self.VIEW_PRODUCT_NAME)
     
     @task(1)
     def view_users(self):
         """User listing"""
-        self.client.get("/api/users", name="High Load - View Users")
+        self.cached_get("/api/users", name=self.VIEW_USERS_NAME)
+
+
+class HighLoadUserNoCache(HighLoadUser):
+    """
+    Same load as HighLoadUser, but every GET is a full, unconditional request that asks
+    any caching proxy to go to the services, for a head-to-head comparison of cached vs
+    uncached throughput
+    """
+    default_headers = {"Cache-Control": "no-cache"}
+    etag_cache_size = 0  # No If-None-Match, so the origin always sends the full body
+    
+    # Separate stats rows, so both classes can run in the same test
+    BROWSE_PRODUCTS_NAME = "High Load NoCache - Browse Products"
+    VIEW_PRODUCT_NAME = "High Load NoCache - View Product"
+    VIEW_USERS_NAME = "High Load NoCache - View Users"
 
 
-class ShoppingFlowUser(HttpUser):
+class ShoppingFlowUser(ApiUser):
     """
     User class that simulates complete shopping flow
     """
-    wait_time = between(2, 5)
+    wait_time = pooled_between(2, 5)
+    
+    USER_TEMPLATE = b'{"firstName":"ShopUser%d","lastName":"Flow","email":"shop%d@example.com","phone":"%d"}'
+    ORDER_TEMPLATE = b'{"orderDesc":"Shopping Flow Order","orderFee":%.2f,"cart":{"cartId":%d}}'
     
     def on_start(self):
         """Initialize shopping flow"""
         self.user_id = None
-        self.order_id = None
     
     @task
     def complete_shopping_flow(self):
-        """Complete shopping flow: register -> browse -> order -> payment"""
-        # Step 1: Register user
-        user_data = {
-            "firstName": f"ShopUser{random.randint(1000, 9999)}",
-            "lastName": "Flow",
-            "email": f"shop{random.randint(1000, 9999)}@example.com",
-            "phone": f"{random.randint(1000000000, 9999999999)}"
-        }
+        """Complete shopping flow: register and browse in parallel -> order"""
+        # Step 1: Register user, while browsing products (step 2) in parallel since it
+        # does not depend on the registration
+        user_body = self.USER_TEMPLATE % (
+            SUFFIX_POOL[next_draw() & POOL_MASK],
+            SUFFIX_POOL[next_draw() & POOL_MASK],
+            PHONE_POOL[next_draw() & POOL_MASK]
+        )
+        register = gevent.spawn(
+            self.client.post, "/api/users", data=user_body, headers=self.json_headers, name="Flow - Register"
+        )
+        browse = gevent.spawn(self.client.get, "/api/products", name="Flow - Browse")
+        try:
+            gevent.joinall([register, browse], raise_error=True)
+        finally:
+            # Don't leave a step running when the user is stopped or the other step raised
+            gevent.killall([register, browse])
         
-        with self.client.post("/api/users", json=user_data, catch_response=True, name="Flow - Register") as response:
-            if response.status_code == 200:
+        response = register.value
+        if response.status_code == 200:
+            body = response.content
+            if body[:1] == b"{":
                 try:
-                    data = response.json()
-                    self.user_id = data.get("userId")
-                except:
+                    self.user_id = orjson.loads(body).get("userId")
+                except orjson.JSONDecodeError:
                     pass
         
-        # Step 2: Browse products
-        self.client.get("/api/products", name="Flow - Browse")
-        
         # Step 3: Create order (if user was created)
         if self.user_id:
-            order_data = {
-                "orderDesc": "Shopping Flow Order",
-                "orderFee": round(random.uniform(50.0, 300.0), 2),
-                "cart": {"cartId": random.randint(1, 1000)}
-            }
-            with self.client.post("/api/orders", json=order_data, catch_response=True, name="Flow - Order") as response:
-                if response.status_code == 200:
-                    try:
-                        data = response.json()
-                        self.order_id = data.get("orderId")
-                    except:
-                        pass
+            order_body = self.ORDER_TEMPLATE % (FLOW_FEE_POOL[next_draw() & POOL_MASK], ID_POOL[next_draw() & POOL_MASK])
+            self.client.post("/api/orders", data=order_body, headers=self.json_headers, name="Flow - Order")
 
 
 # Performance test scenarios
-class UserServicePerformanceTest(HttpUser):
+class UserServicePerformanceTest(ApiUser):
     """Performance test focused on user service"""
-    wait_time = between(0.5, 2)
+    wait_time = pooled_between(0.5, 2)
+    
+    USER_TEMPLATE = b'{"firstName":"PerfUser%d","lastName":"Test","email":"perf%d@example.com","phone":"%d"}'
     
     @task(5)
     def get_users(self):
@@ -264,24 +317,25 @@ class UserServicePerformanceTest(HttpUser):
     @task(3)
     def get_user_by_id(self):
         """Get user by ID"""
-        user_id = random.randint(1, 1000)
-        self.client.get(f"/api/users/{user_id}", name="User Service - Get By ID")
+        user_id = ID_POOL[next_draw() & POOL_MASK]
+        self.client.get(USER_PATHS[user_id], name="User Service - Get By ID")
     
     @task(2)
     def create_user(self):
         """Create new user"""
-        user_data = {
-            "firstName": f"PerfUser{random.randint(1000, 9999)}",
-            "lastName": "Test",
-            "email": f"perf{random.randint(1000, 9999)}@example.com",
-            "phone": f"{random.randint(1000000000, 9999999999)}"
-        }
-        self.client.post("/api/users", json=user_data, name="User Service - Create")
+        user_body = self.USER_TEMPLATE % (
+            SUFFIX_POOL[next_draw() & POOL_MASK],
+            SUFFIX_POOL[next_draw() & POOL_MASK],
+            PHONE_POOL[next_draw() & POOL_MASK]
+        )
+        self.client.post("/api/users", data=user_body, headers=self.json_headers, name="User Service - Create")
 
 
-class OrderServicePerformanceTest(HttpUser):
+class OrderServicePerformanceTest(ApiUser):
     """Performance test focused on order service"""
-    wait_time = between(0.5, 2)
+    wait_time = pooled_between(0.5, 2)
+    
+    ORDER_TEMPLATE = b'{"orderDesc":"Perf Order %d","orderFee":%.2f,"cart":{"cartId":%d}}'
     
     @task(5)
     def get_orders(self):
@@ -291,18 +345,18 @@ class OrderServicePerformanceTest(HttpUser):
     @task(3)
     def get_order_by_id(self):
         """Get order by ID"""
-        order_id = random.randint(1, 1000)
-        self.client.get(f"/api/orders/{order_id}", name="Order Service - Get By ID")
+        order_id = ID_POOL[next_draw() & POOL_MASK]
+        self.client.get(ORDER_PATHS[order_id], name="Order Service - Get By ID")
     
     @task(2)
     def create_order(self):
         """Create new order"""
-        order_data = {
-            "orderDesc": f"Perf Order {random.randint(1000, 9999)}",
-            "orderFee": round(random.uniform(10.0, 500.0), 2),
-            "cart": {"cartId": random.randint(1, 1000)}
-        }
-        self.client.post("/api/orders", json=order_data, name="Order Service - Create")
+        order_body = self.ORDER_TEMPLATE % (
+            SUFFIX_POOL[next_draw() & POOL_MASK],
+            FEE_POOL[next_draw() & POOL_MASK],
+            ID_POOL[next_draw() & POOL_MASK]
+        )
+        self.client.post("/api/orders", data=order_body, headers=self.json_headers, name="Order Service - Create")
 
 
 if __name__ == "__main__":